@@ -0,0 +1,321 @@
+from datetime import timedelta
+from typing import Dict, Iterator, List
+
+import numpy as np
+from sqlalchemy import select, func, delete, insert, update, or_
+from sqlalchemy.orm import Session
+
+from models import (
+    User,
+    ExamHistory,
+    QuestionHistory,
+    QuestionStat,
+    DepartmentStat,
+    AnalyticsContribution,
+    AnalyticsWatermark,
+)
+
+ANALYTICS_CHUNK_SIZE = 50000
+WATERMARK_NAME = "question_histories"
+# Timestamps may only have second resolution, so re-read a small overlap;
+# rows already counted there match their recorded contribution and are skipped
+WATERMARK_OVERLAP = timedelta(seconds=1)
+
+# Sufficient statistics summed per group, so chunks can be merged:
+# attempts, correct, score, score^2, correct * score, time
+_N_SUMS = 6
+_QUESTION_SUMS = (
+    "attempts",
+    "correct",
+    "score_sum",
+    "score_sq_sum",
+    "correct_score_sum",
+    "time_sum",
+)
+# What a graded row adds to the stats, as recorded in analytics_contributions
+_CONTRIBUTION = (
+    "question_id",
+    "depart",
+    "job",
+    "is_correct",
+    "score",
+    "time_used",
+    "question_count",
+)
+
+
+def _group_sums(keys: np.ndarray, values: np.ndarray):
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    sums = np.stack(
+        [
+            np.bincount(inverse, weights=values[:, i], minlength=len(uniq))
+            for i in range(values.shape[1])
+        ],
+        axis=1,
+    )
+    return uniq, sums
+
+
+class _GroupAccumulator:
+    def __init__(self):
+        self._keys = []
+        self._sums = []
+
+    def add(self, keys: np.ndarray, values: np.ndarray):
+        if len(keys):
+            k, s = _group_sums(keys, values)
+            self._keys.append(k)
+            self._sums.append(s)
+
+    def result(self):
+        if not self._keys:
+            return np.array([]), np.zeros((0, _N_SUMS))
+        return _group_sums(np.concatenate(self._keys), np.concatenate(self._sums))
+
+
+def _depart_col():
+    return func.coalesce(User.depart, "")
+
+
+def _job_col():
+    return func.coalesce(User.job, "")
+
+
+def _group_keys(depart: np.ndarray, job: np.ndarray) -> np.ndarray:
+    return depart + "\x1f" + job
+
+
+def iter_changed_history(
+    db: Session, *criteria, chunk_size: int = ANALYTICS_CHUNK_SIZE
+) -> Iterator[list]:
+    """Yield graded history rows whose recorded contribution is out of date.
+
+    Each row is (id, recorded id, *current, *recorded), where current and
+    recorded are the _CONTRIBUTION fields; recorded ones are NULL for rows
+    that were never counted.
+    """
+    ledger = AnalyticsContribution
+    current = (
+        QuestionHistory.question_id,
+        _depart_col(),
+        _job_col(),
+        QuestionHistory.is_correct,
+        ExamHistory.score,
+        ExamHistory.time_used,
+        ExamHistory.question_count,
+    )
+    recorded = [getattr(ledger, name) for name in _CONTRIBUTION]
+    stmt = (
+        select(QuestionHistory.id, ledger.question_history_id, *current, *recorded)
+        .join(
+            ExamHistory,
+            (ExamHistory.exam_id == QuestionHistory.exam_id)
+            & (ExamHistory.user_id == QuestionHistory.user_id),
+        )
+        .join(User, User.id == QuestionHistory.user_id)
+        .outerjoin(ledger, ledger.question_history_id == QuestionHistory.id)
+        .where(
+            QuestionHistory.is_correct.isnot(None),
+            or_(*(c.is_distinct_from(r) for c, r in zip(current, recorded))),
+            *criteria,
+        )
+        .order_by(QuestionHistory.id)
+        .limit(chunk_size)
+    )
+    last_id = 0
+    while True:
+        rows = db.execute(stmt.where(QuestionHistory.id > last_id)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def _contribution_columns(rows: list) -> Dict[str, np.ndarray]:
+    question_id, depart, job, is_correct, score, time_used, question_count = zip(*rows)
+    return {
+        "question_id": np.asarray(question_id, dtype=np.int64),
+        "is_correct": np.asarray(is_correct, dtype=np.float64),
+        "score": np.asarray(score, dtype=np.float64),
+        # time is only recorded per exam, spread it evenly over its questions
+        "time": np.asarray(time_used, dtype=np.float64)
+        / np.asarray(question_count, dtype=np.float64),
+        "group": _group_keys(
+            np.asarray(depart, dtype=object), np.asarray(job, dtype=object)
+        ),
+    }
+
+
+def _chunk_values(chunk: Dict[str, np.ndarray]) -> np.ndarray:
+    x = chunk["is_correct"]
+    y = chunk["score"]
+    return np.stack([np.ones_like(x), x, y, y * y, x * y, chunk["time"]], axis=1)
+
+
+def _record_contributions(db: Session, rows: list) -> None:
+    new, changed = [], []
+    for row in rows:
+        values = dict(zip(_CONTRIBUTION, row[2:9]), question_history_id=row[0])
+        (new if row[1] is None else changed).append(values)
+    if new:
+        db.execute(insert(AnalyticsContribution), new)
+    if changed:
+        db.execute(update(AnalyticsContribution), changed)
+
+
+def _question_rows(keys: np.ndarray, sums: np.ndarray) -> List[dict]:
+    n, c, sy, syy, sxy, st = sums.T
+    cov = n * sxy - c * sy
+    var = (n * c - c * c) * (n * syy - sy * sy)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        disc = np.where(var > 0, cov / np.sqrt(var), np.nan)
+    return [
+        {
+            "question_id": int(k),
+            "attempts": int(round(n[i])),
+            "correct": int(round(c[i])),
+            "correct_rate": float(c[i] / n[i]),
+            "discrimination": None if np.isnan(disc[i]) else float(disc[i]),
+            "avg_time": float(st[i] / n[i]),
+            "score_sum": float(sy[i]),
+            "score_sq_sum": float(syy[i]),
+            "correct_score_sum": float(sxy[i]),
+            "time_sum": float(st[i]),
+        }
+        for i, k in enumerate(keys)
+        if round(n[i]) > 0
+    ]
+
+
+def _department_rows(keys: np.ndarray, sums: np.ndarray) -> List[dict]:
+    n, c, _, _, _, st = sums.T
+    rows = []
+    for i, k in enumerate(keys):
+        if round(n[i]) <= 0:
+            continue
+        depart, job = k.split("\x1f", 1)
+        rows.append(
+            {
+                "depart": depart,
+                "job": job,
+                "attempts": int(round(n[i])),
+                "correct": int(round(c[i])),
+                "correct_rate": float(c[i] / n[i]),
+                "avg_time": float(st[i] / n[i]),
+                "time_sum": float(st[i]),
+            }
+        )
+    return rows
+
+
+def _batches(items: list, size: int = 500) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _merge_question_stats(db: Session, keys: np.ndarray, deltas: np.ndarray) -> None:
+    stats = {}
+    for batch in _batches(keys.tolist()):
+        for stat in db.query(QuestionStat).filter(QuestionStat.question_id.in_(batch)):
+            stats[stat.question_id] = stat
+    current = np.zeros_like(deltas)
+    for i, k in enumerate(keys.tolist()):
+        if k in stats:
+            current[i] = [getattr(stats[k], name) for name in _QUESTION_SUMS]
+    rows = _question_rows(keys, current + deltas)
+    kept = {row["question_id"] for row in rows}
+    gone = [k for k in stats if k not in kept]
+    for batch in _batches(gone):
+        db.execute(delete(QuestionStat).where(QuestionStat.question_id.in_(batch)))
+    updates = [row for row in rows if row["question_id"] in stats]
+    inserts = [row for row in rows if row["question_id"] not in stats]
+    if updates:
+        db.execute(update(QuestionStat), updates)
+    if inserts:
+        db.execute(insert(QuestionStat), inserts)
+
+
+def _merge_department_stats(db: Session, keys: np.ndarray, deltas: np.ndarray) -> None:
+    # few enough groups to read them all
+    stats = {
+        _group_keys(stat.depart, stat.job): stat for stat in db.query(DepartmentStat)
+    }
+    current = np.zeros_like(deltas)
+    for i, k in enumerate(keys.tolist()):
+        if k in stats:
+            current[i, 0] = stats[k].attempts
+            current[i, 1] = stats[k].correct
+            current[i, 5] = stats[k].time_sum
+    rows = _department_rows(keys, current + deltas)
+    kept = {_group_keys(row["depart"], row["job"]) for row in rows}
+    gone = [stats[k].id for k in keys.tolist() if k in stats and k not in kept]
+    if gone:
+        db.execute(delete(DepartmentStat).where(DepartmentStat.id.in_(gone)))
+    updates, inserts = [], []
+    for row in rows:
+        stat = stats.get(_group_keys(row["depart"], row["job"]))
+        if stat is None:
+            inserts.append(row)
+        else:
+            updates.append(dict(row, id=stat.id))
+    if updates:
+        db.execute(update(DepartmentStat), updates)
+    if inserts:
+        db.execute(insert(DepartmentStat), inserts)
+
+
+def refresh_analytics(db: Session, chunk_size: int = ANALYTICS_CHUNK_SIZE) -> int:
+    """Merge history graded or regraded since the watermark into the stats.
+
+    The stat tables keep running sums, and every counted row records its
+    contribution, so a changed row only adds the difference. Returns the
+    number of rows whose contribution changed.
+    """
+    # locking the watermark keeps a manual run from overlapping the workers'
+    mark = db.get(AnalyticsWatermark, WATERMARK_NAME, with_for_update=True)
+    recent = []
+    if mark is not None:
+        recent.append(QuestionHistory.updated_at >= mark.value - WATERMARK_OVERLAP)
+    new_value = db.execute(
+        select(func.max(QuestionHistory.updated_at)).where(
+            QuestionHistory.is_correct.isnot(None), *recent
+        )
+    ).scalar()
+    if new_value is None:
+        return 0
+
+    questions = _GroupAccumulator()
+    departments = _GroupAccumulator()
+    scanned = 0
+    for rows in iter_changed_history(db, *recent, chunk_size=chunk_size):
+        current = _contribution_columns([row[2:9] for row in rows])
+        values = _chunk_values(current)
+        questions.add(current["question_id"], values)
+        departments.add(current["group"], values)
+        # take back what regraded rows added last time
+        recorded = [row[9:16] for row in rows if row[1] is not None]
+        if recorded:
+            previous = _contribution_columns(recorded)
+            values = -_chunk_values(previous)
+            questions.add(previous["question_id"], values)
+            departments.add(previous["group"], values)
+        _record_contributions(db, rows)
+        scanned += len(rows)
+
+    _merge_question_stats(db, *questions.result())
+    _merge_department_stats(db, *departments.result())
+    db.merge(AnalyticsWatermark(name=WATERMARK_NAME, value=new_value))
+    db.commit()
+    return scanned
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"scanned {refresh_analytics(db)} rows")
+    finally:
+        db.close()
@@ -0,0 +1,118 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy import insert, update, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import AnalyticsWatermark
+
+ANALYTICS_REFRESH_INTERVAL_SECONDS = 300
+# Row whose holder is the one worker that runs the periodic refresh
+LEASE_NAME = "refresh_lease"
+
+
+class AnalyticsRefresher:
+    """Runs refresh_analytics periodically on a background thread.
+
+    Every worker runs one, but only the holder of the lease row in
+    analytics_watermarks refreshes; the others take over once it expires.
+    lease_ttl should exceed the longest refresh.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval: float = ANALYTICS_REFRESH_INTERVAL_SECONDS,
+        lease_ttl: float = None,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.lease_ttl = lease_ttl or 3 * interval
+        self.owner = uuid.uuid4().hex
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self) -> int:
+        # analytics pulls in numpy, which workers only need once they refresh
+        from analytics import refresh_analytics
+
+        db = self.session_factory()
+        try:
+            return refresh_analytics(db)
+        finally:
+            db.close()
+
+    def acquire_lease(self) -> bool:
+        """Take or renew the refresh lease; False while another worker holds it."""
+        now = datetime.now(timezone.utc)
+        lease = {"value": now + timedelta(seconds=self.lease_ttl), "owner": self.owner}
+        db = self.session_factory()
+        try:
+            taken = db.execute(
+                update(AnalyticsWatermark)
+                .where(
+                    AnalyticsWatermark.name == LEASE_NAME,
+                    or_(
+                        AnalyticsWatermark.value < now,
+                        AnalyticsWatermark.owner == self.owner,
+                    ),
+                )
+                .values(**lease)
+            ).rowcount
+            if not taken:
+                # no lease row yet, or another worker holds it
+                db.execute(insert(AnalyticsWatermark).values(name=LEASE_NAME, **lease))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release_lease(self) -> None:
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(AnalyticsWatermark)
+                .where(
+                    AnalyticsWatermark.name == LEASE_NAME,
+                    AnalyticsWatermark.owner == self.owner,
+                )
+                .values(value=datetime.now(timezone.utc), owner=None)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="analytics-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            # let another worker take over without waiting for the lease to expire
+            self.release_lease()
+        except Exception as e:
+            print(e)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if self.acquire_lease():
+                    self.refresh()
+            except Exception as e:
+                print(e)
@@ -0,0 +1,109 @@
+import threading
+from typing import Callable, Dict, Iterable
+
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+
+from models import QuestionHistory
+
+AUTOSAVE_FLUSH_INTERVAL_SECONDS = 5
+AUTOSAVE_MAX_PENDING = 500
+
+
+class AnswerBuffer:
+    """Coalesces autosaved answers and writes them to QuestionHistory in batches.
+
+    Answers are keyed by QuestionHistory.id so repeated saves of the same
+    question only keep the latest value until the next flush.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval: float = AUTOSAVE_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = AUTOSAVE_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        # Held while a batch is being written so take() never races a flush
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, history_id: int, answer: str) -> None:
+        with self._lock:
+            self._pending[history_id] = answer
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def take(self, history_ids: Iterable[int]) -> Dict[int, str]:
+        """Remove and return pending answers for the given rows."""
+        with self._flush_lock, self._lock:
+            return {
+                h_id: self._pending.pop(h_id)
+                for h_id in history_ids
+                if h_id in self._pending
+            }
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            db = self.session_factory()
+            try:
+                # Rows graded since the answer was buffered keep their final
+                # answer
+                db.execute(
+                    update(QuestionHistory.__table__)
+                    .where(
+                        QuestionHistory.id == bindparam("h_id"),
+                        QuestionHistory.is_correct.is_(None),
+                    )
+                    .values(user_answer=bindparam("ans")),
+                    [{"h_id": h_id, "ans": ans} for h_id, ans in batch.items()],
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Put the batch back unless newer answers arrived meanwhile
+                with self._lock:
+                    for h_id, ans in batch.items():
+                        self._pending.setdefault(h_id, ans)
+                raise
+            finally:
+                db.close()
+            return len(batch)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="answer-autosave", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(e)
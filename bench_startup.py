@@ -0,0 +1,47 @@
+"""Measure cold worker boot: importing main and running the app's startup.
+
+    python bench_startup.py [runs]
+
+Each run uses a fresh interpreter so imports are not shared between runs.
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+WORKER = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+t2 = asyncio.run(boot())
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "total": t2 - t0}))
+"""
+
+
+def run_once() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", WORKER], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs: int = 5):
+    results = [run_once() for _ in range(runs)]
+    for phase in ("import", "startup", "total"):
+        times = [r[phase] * 1000 for r in results]
+        print(
+            f"{phase:>8}: median {statistics.median(times):7.1f} ms"
+            f"  min {min(times):7.1f} ms  max {max(times):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,277 @@
+import abc
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# REDIS_URL enables cross-worker invalidation and shares exam sessions;
+# CACHE_BACKEND=redis also keeps the cached values themselves in Redis
+# instead of in each worker
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_KEY_PREFIX = "ai_exam:"
+CACHE_INVALIDATION_CHANNEL = "ai_exam:cache-invalidation"
+# how often the in-process backend drops expired entries nobody read again
+CACHE_PURGE_INTERVAL_SECONDS = 60
+
+
+class CacheBackend(abc.ABC):
+    """Key/value storage for cached values; implementations must honour ttl."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]: ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    @abc.abstractmethod
+    def delete(self, keys: Iterable[str]) -> None: ...
+
+    @abc.abstractmethod
+    def hset(self, key: str, mapping: Dict[str, Any], ttl: float) -> None:
+        """Set fields of the hash at key, leaving its other fields alone."""
+
+    @abc.abstractmethod
+    def hgetall(self, key: str) -> Dict[str, Any]: ...
+
+
+class InProcessCacheBackend(CacheBackend):
+    def __init__(self):
+        self._items: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._next_purge = time.monotonic() + CACHE_PURGE_INTERVAL_SECONDS
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_purge:
+                self._purge_expired(now)
+            self._items[key] = (now + ttl, value)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def hset(self, key: str, mapping: Dict[str, Any], ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            fields = dict(item[1]) if item is not None and item[0] > now else {}
+            fields.update(mapping)
+            self._items[key] = (now + ttl, fields)
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        return dict(self.get(key) or {})
+
+    def _purge_expired(self, now: float):
+        expired = [k for k, (expires_at, _) in self._items.items() if expires_at <= now]
+        for k in expired:
+            del self._items[k]
+        self._next_purge = now + CACHE_PURGE_INTERVAL_SECONDS
+
+
+class RedisCacheBackend(CacheBackend):
+    """Stores JSON-encoded values in Redis, shared by all workers."""
+
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def hset(self, key: str, mapping: Dict[str, Any], ttl: float) -> None:
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={k: json.dumps(v) for k, v in mapping.items()})
+        pipe.pexpire(key, int(ttl * 1000))
+        pipe.execute()
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        raw = self.client.hgetall(self.prefix + key)
+        return {k.decode(): json.loads(v) for k, v in raw.items()}
+
+
+class InvalidationBus:
+    """Delivers invalidated cache keys to every subscribed cache."""
+
+    def __init__(self):
+        self._handlers: List[Callable[[List[str]], None]] = []
+
+    def subscribe(self, handler: Callable[[List[str]], None]) -> None:
+        self._handlers.append(handler)
+
+    def publish(self, keys: List[str]) -> None:
+        self._dispatch(keys)
+
+    def _dispatch(self, keys: List[str]) -> None:
+        for handler in self._handlers:
+            handler(keys)
+
+    def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RedisInvalidationBus(InvalidationBus):
+    """Fans invalidations out to the other workers over Redis pub/sub."""
+
+    def __init__(self, client, channel: str = CACHE_INVALIDATION_CHANNEL):
+        super().__init__()
+        self.client = client
+        self.channel = channel
+        # lets a worker skip its own messages, which it already applied
+        self.origin = uuid.uuid4().hex
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def publish(self, keys: List[str]) -> None:
+        self._dispatch(keys)
+        message = json.dumps({"origin": self.origin, "keys": keys})
+        try:
+            self.client.publish(self.channel, message)
+        except Exception as e:
+            # other workers fall back to the entry ttl
+            print(e)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="cache-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    data = json.loads(message["data"])
+                    if data["origin"] != self.origin:
+                        self._dispatch(data["keys"])
+            except Exception as e:
+                print(e)
+                self._stopped.wait(1.0)
+            finally:
+                pubsub.close()
+
+
+class Cache:
+    """A namespace of cached values on a backend, kept coherent through a bus."""
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        backend: CacheBackend,
+        bus: Optional[InvalidationBus] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend
+        self.bus = bus or InvalidationBus()
+        self.bus.subscribe(self._on_invalidate)
+
+    def _key(self, key) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key) -> Optional[Any]:
+        try:
+            return self.backend.get(self._key(key))
+        except Exception as e:
+            # an unreachable backend behaves like a miss
+            print(e)
+            return None
+
+    def set(self, key, value, ttl: float = None) -> None:
+        try:
+            self.backend.set(self._key(key), value, ttl or self.ttl)
+        except Exception as e:
+            print(e)
+
+    def get_or_set(self, key, loader: Callable[[], Any], ttl: float = None) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys) -> None:
+        """Drop keys here and, through the bus, in every other worker."""
+        self.bus.publish([self._key(key) for key in keys])
+
+    def _on_invalidate(self, keys: List[str]) -> None:
+        prefix = self.namespace + ":"
+        try:
+            self.backend.delete([key for key in keys if key.startswith(prefix)])
+        except Exception as e:
+            # the entries then live until their ttl
+            print(e)
+
+
+@functools.lru_cache(maxsize=None)
+def redis_client(url: str):
+    # imported here so that in-process setups do not need the redis package
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+def shared_backend_from_env() -> CacheBackend:
+    """Backend for state every worker must see, such as exam sessions."""
+    if REDIS_URL:
+        return RedisCacheBackend(redis_client(REDIS_URL))
+    return InProcessCacheBackend()
+
+
+def cache_backend_from_env() -> CacheBackend:
+    if CACHE_BACKEND == "redis":
+        if not REDIS_URL:
+            raise RuntimeError("CACHE_BACKEND=redis requires REDIS_URL")
+        return shared_backend_from_env()
+    return InProcessCacheBackend()
+
+
+def invalidation_bus_from_env() -> InvalidationBus:
+    if REDIS_URL:
+        return RedisInvalidationBus(redis_client(REDIS_URL))
+    return InvalidationBus()
@@ -0,0 +1,39 @@
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, Session
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./test.db")
+
+_engine = None
+_engine_lock = threading.Lock()
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine() -> Engine:
+    """Create the engine on first use rather than at import time."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                connect_args = {}
+                if DATABASE_URL.startswith("sqlite"):
+                    connect_args["check_same_thread"] = False
+                _engine = create_engine(DATABASE_URL, connect_args=connect_args)
+                _sessionmaker.configure(bind=_engine)
+    return _engine
+
+
+def SessionLocal() -> Session:
+    get_engine()
+    return _sessionmaker()
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
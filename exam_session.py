@@ -0,0 +1,211 @@
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Any
+
+from sqlalchemy.orm import Session
+
+from models import Question, Exam, ExamHistory, QuestionHistory
+from cache import CacheBackend, InProcessCacheBackend
+
+# Sessions live as long as an exam may run, after which submit falls back to the DB
+EXAM_TIME_LIMIT_SECONDS = 2 * 60 * 60
+
+
+@dataclass
+class ExamSession:
+    exam_id: int
+    user_id: int
+    exam_history_id: int
+    started_at: float
+    question_ids: List[int]
+    # question_id -> expected answer
+    answers: Dict[int, str]
+    # question_id -> QuestionHistory.id
+    history_ids: Dict[int, int]
+    # question_id -> public question fields for responses
+    questions: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    # question_id -> latest autosaved answer
+    saved_answers: Dict[int, str] = field(default_factory=dict)
+    # set once the exam has been submitted; it no longer accepts autosaves
+    graded: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExamSession":
+        # JSON turns the integer question ids used as keys into strings
+        data = dict(data)
+        for name in ("answers", "history_ids", "questions", "saved_answers"):
+            data[name] = {int(k): v for k, v in data[name].items()}
+        return cls(**data)
+
+    def is_correct(self, question_id: int, answer: str) -> bool:
+        # WIP: check if answer is correct
+        return self.answers.get(question_id) == answer
+
+
+class ExamSessionStore:
+    """Exam sessions on a cache backend, e.g. Redis shared by all workers.
+
+    Autosaved answers live in a hash next to the session, one field per
+    question, so concurrent saves to the same exam do not overwrite each
+    other. An unreachable backend behaves like a miss; submit then rebuilds
+    the session from the DB.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: int = EXAM_TIME_LIMIT_SECONDS,
+    ):
+        self.backend = backend or InProcessCacheBackend()
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(exam_id: int, user_id: int) -> str:
+        return f"exam_session:{user_id}:{exam_id}"
+
+    @staticmethod
+    def _answers_key(exam_id: int, user_id: int) -> str:
+        return f"exam_answers:{user_id}:{exam_id}"
+
+    def _remaining(self, session: ExamSession) -> float:
+        # Expire at the end of the exam time limit, not ttl after the last save
+        return session.started_at + self.ttl - time.time()
+
+    def save(self, session: ExamSession) -> None:
+        remaining = self._remaining(session)
+        if remaining <= 0:
+            return
+        data = asdict(session)
+        answers = data.pop("saved_answers")
+        try:
+            self.backend.set(
+                self._key(session.exam_id, session.user_id), data, remaining
+            )
+        except Exception as e:
+            print(e)
+            return
+        self.save_answers(session, answers)
+
+    def save_answers(self, session: ExamSession, answers: Dict[int, str]) -> bool:
+        """Record autosaved answers; False if they could not be stored."""
+        remaining = self._remaining(session)
+        if remaining <= 0:
+            return False
+        if not answers:
+            return True
+        try:
+            self.backend.hset(
+                self._answers_key(session.exam_id, session.user_id),
+                {str(q_id): answer for q_id, answer in answers.items()},
+                remaining,
+            )
+        except Exception as e:
+            print(e)
+            return False
+        return True
+
+    def get(self, exam_id: int, user_id: int) -> Optional[ExamSession]:
+        try:
+            data = self.backend.get(self._key(exam_id, user_id))
+            if data is None:
+                return None
+            answers = self.backend.hgetall(self._answers_key(exam_id, user_id))
+        except Exception as e:
+            print(e)
+            return None
+        return ExamSession.from_dict({**data, "saved_answers": answers})
+
+    def discard(self, exam_id: int, user_id: int) -> None:
+        try:
+            self.backend.delete(
+                [self._key(exam_id, user_id), self._answers_key(exam_id, user_id)]
+            )
+        except Exception as e:
+            print(e)
+
+    def get_or_load(
+        self, db: Session, exam_id: int, user_id: int
+    ) -> Optional[ExamSession]:
+        session = self.get(exam_id, user_id)
+        if session is None:
+            session = load_exam_session(db, exam_id, user_id)
+            if session is not None and not session.graded:
+                # answers saved since the last flush are newer than the DB
+                try:
+                    saved = self.backend.hgetall(self._answers_key(exam_id, user_id))
+                except Exception as e:
+                    print(e)
+                    saved = {}
+                session.saved_answers.update((int(k), v) for k, v in saved.items())
+                self.save(session)
+        return session
+
+
+def question_record(q: Question) -> Dict[str, Any]:
+    return {
+        "question_id": q.id,
+        "question_type": q.question_type,
+        "content": q.content,
+        "options": q.options,
+        "answer": q.answer,
+    }
+
+
+def question_detail(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Public fields of a question record, without the answer."""
+    return {k: v for k, v in record.items() if k != "answer"}
+
+
+def build_exam_session(
+    exam: Exam,
+    eh: ExamHistory,
+    started_at: float,
+    questions: List[Dict[str, Any]],
+    question_histories: List[QuestionHistory],
+) -> ExamSession:
+    q_map = {q["question_id"]: q for q in questions}
+    question_ids = [qh.question_id for qh in question_histories]
+    return ExamSession(
+        exam_id=exam.id,
+        user_id=exam.user_id,
+        exam_history_id=eh.id,
+        started_at=started_at,
+        question_ids=question_ids,
+        answers={q_id: q_map[q_id]["answer"] for q_id in question_ids},
+        history_ids={qh.question_id: qh.id for qh in question_histories},
+        questions={q_id: question_detail(q_map[q_id]) for q_id in question_ids},
+        saved_answers={
+            qh.question_id: qh.user_answer
+            for qh in question_histories
+            if qh.user_answer is not None
+        },
+        graded=any(qh.is_correct is not None for qh in question_histories),
+    )
+
+
+def load_exam_session(db: Session, exam_id: int, user_id: int) -> Optional[ExamSession]:
+    """Rebuild a session from the database after a cache miss or restart."""
+    exam = db.query(Exam).filter(Exam.id == exam_id, Exam.user_id == user_id).first()
+    if not exam:
+        return None
+    eh = (
+        db.query(ExamHistory)
+        .filter(ExamHistory.exam_id == exam_id, ExamHistory.user_id == user_id)
+        .first()
+    )
+    if not eh:
+        return None
+    qhs = (
+        db.query(QuestionHistory)
+        .filter(QuestionHistory.exam_id == exam_id, QuestionHistory.user_id == user_id)
+        .all()
+    )
+    q_ids = [qh.question_id for qh in qhs]
+    questions = db.query(Question).filter(Question.id.in_(q_ids)).all()
+    return build_exam_session(
+        exam,
+        eh,
+        eh.created_at.timestamp(),
+        [question_record(q) for q in questions],
+        qhs,
+    )
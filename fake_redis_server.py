@@ -0,0 +1,30 @@
+"""Local stand-in for a Redis server, to run several workers without Redis.
+
+    pip install fakeredis
+    python fake_redis_server.py [port]
+    REDIS_URL=redis://127.0.0.1:6379/0 CACHE_BACKEND=redis \\
+        uvicorn main:create_app --factory --workers 4
+
+Data lives in this process's memory and is lost when it exits.
+"""
+
+import sys
+
+from fakeredis import TcpFakeServer
+
+
+def main(port: int = 6379):
+    server = TcpFakeServer(("127.0.0.1", port))
+    # don't let open client connections keep the process alive on exit
+    server.daemon_threads = True
+    print(f"fake redis listening on 127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 6379)
@@ -1,21 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from sqlalchemy import create_engine, select, func
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import select, func, update, null
+from sqlalchemy.orm import Session
 from datetime import datetime
+from contextlib import asynccontextmanager
 from jose import jwt
+import os
 import time
 import asyncio
+import threading
 from math import ceil
 
 
-from models import Base, User, Exercise, Question, Exam, ExamHistory, QuestionHistory
+from models import (
+    User,
+    Exercise,
+    Question,
+    Exam,
+    ExamHistory,
+    QuestionHistory,
+    QuestionStat,
+    DepartmentStat,
+)
 from schemas import (
     UserRegisterParams,
     UserLoginParams,
     UserResponse,
+    TokenRefreshParams,
+    TokenResponse,
     ExerciseDetailResponse,
     ExerciseListResponse,
     QuestionDetailResponse,
@@ -23,72 +37,166 @@ from schemas import (
     ExamDetailResponse,
     ExamSubmitParams,
     ExamSubmitResponse,
+    ExamAutosaveParams,
+    ExamAutosaveResponse,
     ExamHistoryDetailResponse,
     ExamHistoryListResponse,
     QuestionHistoryDetailResponse,
     QuestionHistoryListResponse,
+    QuestionStatResponse,
+    QuestionStatListResponse,
+    DepartmentStatResponse,
+    DepartmentStatListResponse,
     AIChatParams,
     AIChatResponse,
     UserAnswer,
 )
-from utils import (
-    get_password_hash,
-    verify_password,
-    create_access_token,
-    SECRET_KEY,
-    ALGORITHM,
+from utils import get_password_hash, verify_password
+from tokens import create_access_token, create_refresh_token, decode_token
+from database import SessionLocal, get_db
+from migrate import migrate
+from cache import (
+    Cache,
+    cache_backend_from_env,
+    invalidation_bus_from_env,
+    shared_backend_from_env,
+)
+from exam_session import (
+    ExamSessionStore,
+    build_exam_session,
+    question_record,
+    question_detail,
 )
+from autosave import AnswerBuffer
+from analytics_refresher import AnalyticsRefresher
+
+QUESTION_BANK_TTL_SECONDS = 10 * 60
+LEADERBOARD_TTL_SECONDS = 30
 
-DATABASE_URL = "sqlite:///./test.db"
+cache_backend = cache_backend_from_env()
+cache_bus = invalidation_bus_from_env()
+# exercise_id -> question records, answers included
+question_bank = Cache(
+    "question_bank", QUESTION_BANK_TTL_SECONDS, cache_backend, cache_bus
+)
+leaderboard_cache = Cache(
+    "leaderboard", LEADERBOARD_TTL_SECONDS, cache_backend, cache_bus
+)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-Base.metadata.create_all(engine)
+# Sessions are shared whenever REDIS_URL is set so any worker can grade them
+exam_sessions = ExamSessionStore(shared_backend_from_env())
+answer_buffer = AnswerBuffer(SessionLocal)
+analytics_refresher = AnalyticsRefresher(SessionLocal)
 
-app = FastAPI()
+router = APIRouter()
 
 security = HTTPBearer()
 
 
-def get_db():
-    db = SessionLocal()
+def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> int:
+    """Authorize from the token's claims alone, without loading the user."""
     try:
-        yield db
-    finally:
-        db.close()
+        payload = decode_token(credentials.credentials)
+    except jwt.JWTError as e:
+        print(e)
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(
+            status_code=401, detail="Invalid authentication credentials"
+        )
+    return int(user_id)
 
 
 def get_current_user(
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=401, detail="Invalid authentication credentials"
-            )
-        user = db.query(User).filter(User.id == user_id).first()
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.JWTError as e:
-        print(e)
-        raise HTTPException(status_code=401, detail="Invalid token")
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+
+def get_exercise_questions(db: Session, exercise_ids: List[int]) -> List[dict]:
+    """Question records for the given exercises, served from the question bank."""
+    records = []
+    missing = []
+    for ex_id in set(exercise_ids):
+        cached = question_bank.get(ex_id)
+        if cached is None:
+            missing.append(ex_id)
+        else:
+            records.extend(cached)
+    if missing:
+        loaded = {ex_id: [] for ex_id in missing}
+        for q in db.query(Question).filter(Question.exercise_id.in_(missing)):
+            loaded[q.exercise_id].append(question_record(q))
+        for ex_id, ex_records in loaded.items():
+            question_bank.set(ex_id, ex_records)
+            records.extend(ex_records)
+    return sorted(records, key=lambda r: r["question_id"])
+
+
+def invalidate_exercises(exercise_ids: List[int]):
+    """Call after importing or editing exercise content."""
+    question_bank.invalidate(*exercise_ids)
 
 
 # Placeholder function for making exam detail from exercises
-def make_exam_from_exercise(db: Session, exercise_ids: List[int]) -> List[int]:
+def make_exam_from_exercise(db: Session, exercise_ids: List[int]) -> List[dict]:
     # Collect all questions from these exercises
-    questions = db.query(Question).filter(Question.exercise_id.in_(exercise_ids)).all()
+    questions = get_exercise_questions(db, exercise_ids)
     # WIP: create exam
-    question_ids = [q.id for q in questions]
-    return question_ids
+    return questions
+
+
+def load_leaderboard(db: Session, column) -> List[User]:
+    return db.query(User).order_by(column.desc()).all()
+
+
+def leaderboard_credits_data(db: Session) -> List[dict]:
+    return [
+        {
+            "id": u.id,
+            "name": u.name,
+            "credit": u.credit,
+            "depart": u.depart,
+            "job": u.job,
+        }
+        for u in load_leaderboard(db, User.credit)
+    ]
+
+
+def leaderboard_times_data(db: Session) -> List[dict]:
+    return [
+        {
+            "id": u.id,
+            "name": u.name,
+            "learning_time": u.learning_time,
+            "depart": u.depart,
+            "job": u.job,
+        }
+        for u in load_leaderboard(db, User.learning_time)
+    ]
 
 
-@app.post("/api/user/register", response_model=UserResponse)
+def warm_up_caches():
+    db = SessionLocal()
+    try:
+        exercise_ids = [ex_id for (ex_id,) in db.query(Exercise.id)]
+        get_exercise_questions(db, exercise_ids)
+        leaderboard_cache.set("credits", leaderboard_credits_data(db))
+        leaderboard_cache.set("times", leaderboard_times_data(db))
+    except Exception as e:
+        print(e)
+    finally:
+        db.close()
+
+
+@router.post("/api/user/register", response_model=UserResponse)
 def user_register(params: UserRegisterParams, db: Session = Depends(get_db)):
     # Check if login_number exists
     existing = db.query(User).filter(User.login_number == params.login_number).first()
@@ -107,9 +215,12 @@ def user_register(params: UserRegisterParams, db: Session = Depends(get_db)):
     db.add(user)
     db.commit()
     db.refresh(user)
+    leaderboard_cache.invalidate("credits", "times")
     access_token = create_access_token({"sub": str(user.id)})
+    refresh_token = create_refresh_token({"sub": str(user.id)})
     return UserResponse(
         jwt_token=access_token,
+        refresh_token=refresh_token,
         name=user.name,
         id=user.id,
         depart=user.depart,
@@ -117,7 +228,7 @@ def user_register(params: UserRegisterParams, db: Session = Depends(get_db)):
     )
 
 
-@app.post("/api/user/login", response_model=UserResponse)
+@router.post("/api/user/login", response_model=UserResponse)
 def user_login(params: UserLoginParams, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.login_number == params.login_number).first()
     if not user:
@@ -125,8 +236,10 @@ def user_login(params: UserLoginParams, db: Session = Depends(get_db)):
     if not verify_password(params.password, user.password):
         raise HTTPException(status_code=401, detail="Incorrect password")
     access_token = create_access_token({"sub": str(user.id)})
+    refresh_token = create_refresh_token({"sub": str(user.id)})
     return UserResponse(
         jwt_token=access_token,
+        refresh_token=refresh_token,
         name=user.name,
         id=user.id,
         depart=user.depart,
@@ -134,7 +247,24 @@ def user_login(params: UserLoginParams, db: Session = Depends(get_db)):
     )
 
 
-@app.get("/api/exercise", response_model=ExerciseListResponse)
+@router.post("/api/user/refresh", response_model=TokenResponse)
+def user_refresh(params: TokenRefreshParams, db: Session = Depends(get_db)):
+    try:
+        payload = decode_token(params.refresh_token, token_type="refresh")
+    except jwt.JWTError as e:
+        print(e)
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("sub")
+    user = db.query(User).filter(User.id == user_id).first() if user_id else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return TokenResponse(
+        jwt_token=create_access_token({"sub": str(user.id)}),
+        refresh_token=create_refresh_token({"sub": str(user.id)}),
+    )
+
+
+@router.get("/api/exercise", response_model=ExerciseListResponse)
 def get_exercise_list(page: int = 1, limit: int = 10, db: Session = Depends(get_db)):
     total = db.query(func.count(Exercise.id)).scalar()
     if limit <= 0:
@@ -144,16 +274,10 @@ def get_exercise_list(page: int = 1, limit: int = 10, db: Session = Depends(get_
     exercises = db.query(Exercise).offset((page - 1) * limit).limit(limit).all()
     response = []
     for ex in exercises:
-        questions_resp = []
-        for q in ex.questions:
-            questions_resp.append(
-                QuestionDetailResponse(
-                    question_id=q.id,
-                    question_type=q.question_type,
-                    content=q.content,
-                    options=q.options,
-                )
-            )
+        questions_resp = [
+            QuestionDetailResponse(**question_detail(q))
+            for q in get_exercise_questions(db, [ex.id])
+        ]
         response.append(
             ExerciseDetailResponse(
                 exercise_id=ex.id,
@@ -170,27 +294,21 @@ def get_exercise_list(page: int = 1, limit: int = 10, db: Session = Depends(get_
     )
 
 
-@app.get("/api/exercise/{id}", response_model=ExerciseDetailResponse)
+@router.get("/api/exercise/{id}", response_model=ExerciseDetailResponse)
 def get_exercise_detail(id: int, db: Session = Depends(get_db)):
     ex = db.query(Exercise).filter(Exercise.id == id).first()
     if not ex:
         raise HTTPException(status_code=404, detail="Exercise not found")
-    questions_resp = []
-    for q in ex.questions:
-        questions_resp.append(
-            QuestionDetailResponse(
-                question_id=q.id,
-                question_type=q.question_type,
-                content=q.content,
-                options=q.options,
-            )
-        )
+    questions_resp = [
+        QuestionDetailResponse(**question_detail(q))
+        for q in get_exercise_questions(db, [ex.id])
+    ]
     return ExerciseDetailResponse(
         exercise_id=ex.id, title=ex.title, content=ex.content, questions=questions_resp
     )
 
 
-@app.post("/api/exam", response_model=ExamDetailResponse)
+@router.post("/api/exam", response_model=ExamDetailResponse)
 def create_exam(
     params: ExamCreateParams,
     user: User = Depends(get_current_user),
@@ -201,188 +319,177 @@ def create_exam(
     db.commit()
     db.refresh(exam)
 
-    question_ids = make_exam_from_exercise(db, params.exercise_ids)
+    questions = make_exam_from_exercise(db, params.exercise_ids)
 
-    # Insert QuestionHistory
-    for q_id in question_ids:
-        qh = QuestionHistory(user_id=user.id, question_id=q_id, exam_id=exam.id)
-        db.add(qh)
+    # Insert QuestionHistory, ungraded until the exam is submitted
+    qhs = [
+        QuestionHistory(user_id=user.id, question_id=q["question_id"], exam_id=exam.id)
+        for q in questions
+    ]
+    db.add_all(qhs)
 
     # Insert ExamHistory
-    eh = ExamHistory(user_id=user.id, exam_id=exam.id, score=0, time_used=0)
+    eh = ExamHistory(
+        user_id=user.id,
+        exam_id=exam.id,
+        score=0,
+        time_used=0,
+        question_count=len(qhs),
+    )
     db.add(eh)
+    db.flush()
+
+    # Keep everything submit needs in the session so it does not re-query;
+    # start from created_at like a session rebuilt from the DB would
+    session = build_exam_session(exam, eh, eh.created_at.timestamp(), questions, qhs)
     db.commit()
+    exam_sessions.save(session)
 
     # Build response
-    questions = db.query(Question).filter(Question.id.in_(question_ids)).all()
-    questions_resp = []
-    for q in questions:
-        questions_resp.append(
-            QuestionDetailResponse(
-                question_id=q.id,
-                question_type=q.question_type,
-                content=q.content,
-                options=q.options,
-            )
-        )
+    questions_resp = [
+        QuestionDetailResponse(**session.questions[q_id])
+        for q_id in session.question_ids
+    ]
 
-    return ExamDetailResponse(exam_id=exam.id, questions=questions_resp)
+    return ExamDetailResponse(exam_id=session.exam_id, questions=questions_resp)
 
 
-@app.post("/api/exam/submit", response_model=ExamSubmitResponse)
+@router.post("/api/exam/submit", response_model=ExamSubmitResponse)
 def submit_exam(
     params: ExamSubmitParams,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    # Calculate score and update question_history
-    exam = (
-        db.query(Exam)
-        .filter(Exam.id == params.exam_id, Exam.user_id == user.id)
-        .first()
-    )
-    if not exam:
+    # Grade from the exam session, rebuilding it from the DB on a cache miss
+    session = exam_sessions.get_or_load(db, params.exam_id, user.id)
+    if not session:
         raise HTTPException(status_code=404, detail="Exam not found")
 
-    # Fetch exam_history
-    eh = (
-        db.query(ExamHistory)
-        .filter(ExamHistory.exam_id == params.exam_id, ExamHistory.user_id == user.id)
-        .first()
-    )
-    if not eh:
-        raise HTTPException(status_code=400, detail="ExamHistory not found")
+    elapsed_time = int(time.time() - session.started_at)
 
-    # get start time
-    start_time = eh.created_at
-    elapsed_time = int(time.time() - start_time.timestamp())
+    # Final answers: autosaved state, then the payload. Autosaves reach the
+    # session store before this worker's buffer, so unflushed answers only
+    # fill in what a session rebuilt from the DB is missing
+    answers = dict(session.saved_answers)
+    pending = answer_buffer.take(session.history_ids.values())
+    for q_id, qh_id in session.history_ids.items():
+        if qh_id in pending:
+            answers.setdefault(q_id, pending[qh_id])
+    for ua in params.user_answers:
+        if ua.question_id in session.history_ids:
+            answers[ua.question_id] = ua.answer
 
+    # Calculate score and grade every question_history row of the exam
     score = 0
-    question_ids = [ua.question_id for ua in params.user_answers]
-    questions = db.query(Question).filter(Question.id.in_(question_ids)).all()
-    q_map = {q.id: q for q in questions}
-
-    for ua in params.user_answers:
-        qhist = (
-            db.query(QuestionHistory)
-            .filter(
-                QuestionHistory.user_id == user.id,
-                QuestionHistory.exam_id == params.exam_id,
-                QuestionHistory.question_id == ua.question_id,
-            )
-            .first()
-        )
-        if not qhist:
-            # If there's no question_history record, skip or raise
-            continue
-        correct_answer = q_map[ua.question_id].answer
-        # WIP: check if answer is correct
-        is_correct = correct_answer == ua.answer
+    graded = {}
+    for q_id in session.question_ids:
+        answer = answers.get(q_id)
+        is_correct = answer is not None and session.is_correct(q_id, answer)
         if is_correct:
             score += 10
-        qhist.user_answer = ua.answer
-        qhist.is_correct = is_correct
-        db.add(qhist)
+        graded[q_id] = {
+            "id": session.history_ids[q_id],
+            "user_answer": answer,
+            "is_correct": is_correct,
+        }
 
-        # Check if first time correct
-        # count attempts for this question by user
-        count_attempts = (
-            db.query(QuestionHistory)
+    # Check if first time correct: questions never answered before by this user
+    correct_ids = [q_id for q_id, row in graded.items() if row["is_correct"]]
+    if correct_ids:
+        answered_before = {
+            q_id
+            for (q_id,) in db.query(QuestionHistory.question_id)
             .filter(
                 QuestionHistory.user_id == user.id,
-                QuestionHistory.question_id == ua.question_id,
+                QuestionHistory.question_id.in_(correct_ids),
                 QuestionHistory.user_answer.isnot(None),
+                # autosaved answers of unsubmitted exams are not attempts
+                QuestionHistory.is_correct.isnot(None),
             )
-            .count()
-        )
-
-        if count_attempts == 0 and is_correct:
-            # first time correct, update user credit
-            user.credit += 10
-            db.add(user)
-
-    eh.score = score
-    eh.time_used = elapsed_time
+            .distinct()
+        }
+        # first time correct, update user credit
+        user.credit += 10 * len(set(correct_ids) - answered_before)
+
+    if graded:
+        db.execute(update(QuestionHistory), list(graded.values()))
+    db.execute(
+        update(ExamHistory),
+        [{"id": session.exam_history_id, "score": score, "time_used": elapsed_time}],
+    )
     user.learning_time += elapsed_time
     db.add(user)
-    db.add(eh)
     db.commit()
+    exam_sessions.discard(session.exam_id, user.id)
+    leaderboard_cache.invalidate("credits", "times")
 
     # Return response
     # questions for the exam
-    exam_question_histories = (
-        db.query(QuestionHistory)
-        .filter(
-            QuestionHistory.exam_id == params.exam_id,
-            QuestionHistory.user_id == user.id,
-        )
-        .all()
-    )
-    question_ids = [qh.question_id for qh in exam_question_histories]
-    exam_questions = db.query(Question).filter(Question.id.in_(question_ids)).all()
-
-    questions_resp = []
-    q_map = {q.id: q for q in exam_questions}
-    for qh in exam_question_histories:
-        q = q_map[qh.question_id]
-        questions_resp.append(
-            QuestionDetailResponse(
-                question_id=q.id,
-                question_type=q.question_type,
-                content=q.content,
-                options=q.options,
-            )
-        )
+    questions_resp = [
+        QuestionDetailResponse(**session.questions[q_id])
+        for q_id in session.question_ids
+    ]
 
     return ExamSubmitResponse(
         exam_id=params.exam_id,
         score=score,
         time=elapsed_time,
         questions=questions_resp,
-        user_answers=params.user_answers,
+        user_answers=[
+            UserAnswer(question_id=q_id, answer=answers[q_id])
+            for q_id in session.question_ids
+            if q_id in answers
+        ],
     )
 
 
-@app.get("/api/leaderboard/credits")
+@router.post("/api/exam/autosave", response_model=ExamAutosaveResponse)
+def autosave_exam(
+    params: ExamAutosaveParams,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    session = exam_sessions.get_or_load(db, params.exam_id, user_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    if session.graded:
+        raise HTTPException(status_code=409, detail="Exam already submitted")
+
+    answers = {
+        ua.question_id: ua.answer
+        for ua in params.user_answers
+        if ua.question_id in session.history_ids
+    }
+    for q_id, answer in answers.items():
+        answer_buffer.put(session.history_ids[q_id], answer)
+    # Acknowledge only once another worker's submit could see the answers:
+    # in the shared session store, or else written through to the DB
+    if not exam_sessions.save_answers(session, answers):
+        answer_buffer.flush()
+
+    return ExamAutosaveResponse(exam_id=session.exam_id, saved=len(answers))
+
+
+@router.get("/api/leaderboard/credits")
 def leaderboard_credits(db: Session = Depends(get_db)):
-    users = db.query(User).order_by(User.credit.desc()).all()
-    return [
-        {
-            "id": u.id,
-            "name": u.name,
-            "credit": u.credit,
-            "depart": u.depart,
-            "job": u.job,
-        }
-        for u in users
-    ]
+    return leaderboard_cache.get_or_set("credits", lambda: leaderboard_credits_data(db))
 
 
-@app.get("/api/leaderboard/times")
+@router.get("/api/leaderboard/times")
 def leaderboard_times(db: Session = Depends(get_db)):
-    users = db.query(User).order_by(User.learning_time.desc()).all()
-    return [
-        {
-            "id": u.id,
-            "name": u.name,
-            "learning_time": u.learning_time,
-            "depart": u.depart,
-            "job": u.job,
-        }
-        for u in users
-    ]
+    return leaderboard_cache.get_or_set("times", lambda: leaderboard_times_data(db))
 
 
-@app.get("/api/exam/history", response_model=ExamHistoryListResponse)
+@router.get("/api/exam/history", response_model=ExamHistoryListResponse)
 def exam_history(
     page: int = 1,
     limit: int = 10,
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     total = (
         db.query(func.count(ExamHistory.id))
-        .filter(ExamHistory.user_id == user.id)
+        .filter(ExamHistory.user_id == user_id)
         .scalar()
     )
     if limit <= 0:
@@ -391,7 +498,7 @@ def exam_history(
 
     histories = (
         db.query(ExamHistory)
-        .filter(ExamHistory.user_id == user.id)
+        .filter(ExamHistory.user_id == user_id)
         .offset((page - 1) * limit)
         .limit(limit)
         .all()
@@ -401,7 +508,7 @@ def exam_history(
         qhs = (
             db.query(QuestionHistory)
             .filter(
-                QuestionHistory.exam_id == h.exam_id, QuestionHistory.user_id == user.id
+                QuestionHistory.exam_id == h.exam_id, QuestionHistory.user_id == user_id
             )
             .all()
         )
@@ -438,13 +545,13 @@ def exam_history(
     )
 
 
-@app.get("/api/exam/history/{id}", response_model=ExamHistoryDetailResponse)
+@router.get("/api/exam/history/{id}", response_model=ExamHistoryDetailResponse)
 def exam_history_detail(
-    id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)
 ):
     h = (
         db.query(ExamHistory)
-        .filter(ExamHistory.exam_id == id, ExamHistory.user_id == user.id)
+        .filter(ExamHistory.exam_id == id, ExamHistory.user_id == user_id)
         .first()
     )
     if not h:
@@ -452,7 +559,7 @@ def exam_history_detail(
     qhs = (
         db.query(QuestionHistory)
         .filter(
-            QuestionHistory.exam_id == h.exam_id, QuestionHistory.user_id == user.id
+            QuestionHistory.exam_id == h.exam_id, QuestionHistory.user_id == user_id
         )
         .all()
     )
@@ -484,16 +591,16 @@ def exam_history_detail(
     )
 
 
-@app.get("/api/question", response_model=QuestionHistoryListResponse)
+@router.get("/api/question", response_model=QuestionHistoryListResponse)
 def question_history_list(
     page: int = 1,
     limit: int = 10,
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     total = (
         db.query(func.count(QuestionHistory.id))
-        .filter(QuestionHistory.user_id == user.id, QuestionHistory.is_correct == False)
+        .filter(QuestionHistory.user_id == user_id, QuestionHistory.is_correct == False)
         .scalar()
     )
     if limit <= 0:
@@ -502,7 +609,7 @@ def question_history_list(
 
     qhs = (
         db.query(QuestionHistory)
-        .filter(QuestionHistory.user_id == user.id, QuestionHistory.is_correct == False)
+        .filter(QuestionHistory.user_id == user_id, QuestionHistory.is_correct == False)
         .offset((page - 1) * limit)
         .limit(limit)
         .all()
@@ -523,6 +630,98 @@ def question_history_list(
     )
 
 
+def question_stat_response(stat: QuestionStat) -> QuestionStatResponse:
+    return QuestionStatResponse(
+        question_id=stat.question_id,
+        attempts=stat.attempts,
+        correct=stat.correct,
+        correct_rate=stat.correct_rate,
+        discrimination=stat.discrimination,
+        avg_time=stat.avg_time,
+    )
+
+
+@router.get("/api/analytics/questions", response_model=QuestionStatListResponse)
+def question_stats(
+    page: int = 1,
+    limit: int = 10,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    total = db.query(func.count(QuestionStat.question_id)).scalar()
+    if limit <= 0:
+        limit = 10
+    total_pages = ceil(total / limit) if total > 0 else 1
+
+    # hardest questions first
+    stats = (
+        db.query(QuestionStat)
+        .order_by(QuestionStat.correct_rate, QuestionStat.question_id)
+        .offset((page - 1) * limit)
+        .limit(limit)
+        .all()
+    )
+    return QuestionStatListResponse(
+        stats=[question_stat_response(s) for s in stats],
+        total=total,
+        current_page=page,
+        total_page=total_pages,
+    )
+
+
+@router.get("/api/analytics/questions/{id}", response_model=QuestionStatResponse)
+def question_stat_detail(
+    id: int, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)
+):
+    stat = db.get(QuestionStat, id)
+    if not stat:
+        raise HTTPException(status_code=404, detail="Question stats not found")
+    return question_stat_response(stat)
+
+
+@router.get("/api/analytics/departments", response_model=DepartmentStatListResponse)
+def department_stats(
+    depart: Optional[str] = None,
+    by_job: bool = True,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    if by_job:
+        query = db.query(
+            DepartmentStat.depart,
+            DepartmentStat.job,
+            DepartmentStat.attempts,
+            DepartmentStat.correct,
+            DepartmentStat.avg_time,
+        )
+    else:
+        # roll jobs up into their department
+        attempts = func.sum(DepartmentStat.attempts)
+        query = db.query(
+            DepartmentStat.depart,
+            null(),
+            attempts,
+            func.sum(DepartmentStat.correct),
+            func.sum(DepartmentStat.time_sum) / attempts,
+        ).group_by(DepartmentStat.depart)
+    if depart is not None:
+        query = query.filter(DepartmentStat.depart == depart)
+
+    return DepartmentStatListResponse(
+        stats=[
+            DepartmentStatResponse(
+                depart=d,
+                job=j,
+                attempts=n,
+                correct=c,
+                correct_rate=c / n if n else 0,
+                avg_time=t or 0,
+            )
+            for d, j, n, c, t in query.order_by(DepartmentStat.depart).all()
+        ]
+    )
+
+
 async def generate_text():
     """Simulates an AI chat response generator."""
     responses = [
@@ -537,10 +736,10 @@ async def generate_text():
         await asyncio.sleep(1)  # Simulate delay between chunks
 
 
-@app.post("/api/question/chat", response_model=AIChatResponse)
+@router.post("/api/question/chat", response_model=AIChatResponse)
 def ai_chat(
     params: AIChatParams,
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     # Placeholder: This would call an AI model or service
@@ -548,3 +747,28 @@ def ai_chat(
     return StreamingResponse(generate_text(), media_type="text/plain")
 
     return AIChatResponse(ai_output=f"AI response to: {params.content}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes belong to `python migrate.py`; this is for local development
+    if os.environ.get("DB_AUTO_MIGRATE"):
+        migrate()
+    cache_bus.start()
+    answer_buffer.start()
+    analytics_refresher.start()
+    # Warm caches without holding up readiness
+    threading.Thread(target=warm_up_caches, name="cache-warm-up", daemon=True).start()
+    yield
+    analytics_refresher.stop()
+    answer_buffer.stop()
+    cache_bus.close()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,111 @@
+from sqlalchemy import delete, exists, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+
+from database import get_engine
+from models import (
+    Base,
+    ExamHistory,
+    QuestionHistory,
+    SchemaMigration,
+    QuestionStat,
+    DepartmentStat,
+    AnalyticsContribution,
+    AnalyticsWatermark,
+)
+
+
+def add_missing_columns(conn: Connection) -> None:
+    """Add model columns missing from existing tables; they start out NULL."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                col_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+                    )
+                )
+
+
+def create_missing_indexes(conn: Connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def reset_unsubmitted_grades(conn: Connection) -> None:
+    """Mark rows of exams that were never submitted as ungraded.
+
+    is_correct used to default to False, so open exams were indistinguishable
+    from wrong answers. Submitting records the elapsed time and every answer
+    given, so an exam with neither was never submitted.
+    """
+    answered = exists().where(
+        QuestionHistory.exam_id == ExamHistory.exam_id,
+        QuestionHistory.user_answer.isnot(None),
+    )
+    unsubmitted = select(ExamHistory.exam_id).where(
+        ExamHistory.score == 0, ExamHistory.time_used == 0, ~answered
+    )
+    conn.execute(
+        update(QuestionHistory)
+        .where(
+            QuestionHistory.is_correct.is_(False),
+            QuestionHistory.exam_id.in_(unsubmitted),
+        )
+        .values(is_correct=None)
+    )
+
+
+def backfill_question_counts(conn: Connection) -> None:
+    counts = (
+        select(func.count(QuestionHistory.id))
+        .where(
+            QuestionHistory.exam_id == ExamHistory.exam_id,
+            QuestionHistory.user_id == ExamHistory.user_id,
+        )
+        .scalar_subquery()
+    )
+    conn.execute(
+        update(ExamHistory)
+        .where(ExamHistory.question_count.is_(None))
+        .values(question_count=counts)
+    )
+
+
+def reset_analytics(conn: Connection) -> None:
+    """Drop derived analytics so the next refresh rebuilds them from history."""
+    for model in (QuestionStat, DepartmentStat, AnalyticsContribution):
+        conn.execute(delete(model))
+    conn.execute(delete(AnalyticsWatermark))
+
+
+# Applied in order, each at most once per database
+DATA_MIGRATIONS = [
+    ("reset_unsubmitted_grades", reset_unsubmitted_grades),
+    ("backfill_question_counts", backfill_question_counts),
+]
+
+
+def migrate(engine: Engine = None) -> None:
+    """Bring the schema up to date and apply pending data migrations.
+
+    Run once per deploy, not in every worker.
+    """
+    engine = engine or get_engine()
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        add_missing_columns(conn)
+        create_missing_indexes(conn)
+        applied = set(conn.execute(select(SchemaMigration.name)).scalars())
+        for name, step in DATA_MIGRATIONS:
+            if name not in applied:
+                step(conn)
+                conn.execute(insert(SchemaMigration).values(name=name))
+
+
+if __name__ == "__main__":
+    migrate()
+    print("schema up to date")
@@ -1,4 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON, ForeignKey, DateTime
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Boolean,
+    JSON,
+    ForeignKey,
+    DateTime,
+    Float,
+    UniqueConstraint,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -63,11 +74,13 @@ class Exam(Base):
 
 class ExamHistory(Base):
     __tablename__ = "exam_histories"
+    __table_args__ = (Index("ix_exam_histories_exam_id_user_id", "exam_id", "user_id"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     exam_id = Column(Integer, ForeignKey("exams.id"))
     score = Column(Integer, default=0)
     time_used = Column(Integer, default=0)  # time in seconds maybe
+    question_count = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -83,11 +96,82 @@ class QuestionHistory(Base):
     question_id = Column(Integer, ForeignKey("questions.id"))
     exam_id = Column(Integer, ForeignKey("exams.id"))
     user_answer = Column(String, nullable=True)
-    is_correct = Column(Boolean, default=False)
+    # NULL until the exam is submitted and the answer graded
+    is_correct = Column(Boolean, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
-        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
     )
     user = relationship("User", backref="question_histories")
     question = relationship("Question", backref="question_histories")
     exam = relationship("Exam", backref="question_histories")
+
+
+class QuestionStat(Base):
+    __tablename__ = "question_stats"
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    attempts = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    correct_rate = Column(Float, default=0)
+    # point-biserial correlation between correctness and exam score
+    discrimination = Column(Float, nullable=True)
+    avg_time = Column(Float, default=0)  # estimated seconds per attempt
+    # running sums the rates above are derived from, merged on every refresh
+    score_sum = Column(Float, default=0)
+    score_sq_sum = Column(Float, default=0)
+    correct_score_sum = Column(Float, default=0)
+    time_sum = Column(Float, default=0)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class DepartmentStat(Base):
+    __tablename__ = "department_stats"
+    __table_args__ = (UniqueConstraint("depart", "job"),)
+    id = Column(Integer, primary_key=True, index=True)
+    depart = Column(String)
+    job = Column(String)
+    attempts = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    correct_rate = Column(Float, default=0)
+    avg_time = Column(Float, default=0)
+    time_sum = Column(Float, default=0)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class AnalyticsContribution(Base):
+    """What each graded question_history row last added to the stat tables."""
+
+    __tablename__ = "analytics_contributions"
+    question_history_id = Column(
+        Integer, ForeignKey("question_histories.id"), primary_key=True
+    )
+    question_id = Column(Integer)
+    depart = Column(String)
+    job = Column(String)
+    is_correct = Column(Boolean)
+    score = Column(Integer)
+    time_used = Column(Integer)
+    question_count = Column(Integer)
+
+
+class AnalyticsWatermark(Base):
+    __tablename__ = "analytics_watermarks"
+    name = Column(String, primary_key=True)
+    value = Column(DateTime(timezone=True))
+    # set on lease rows, whose value is when the lease expires
+    owner = Column(String, nullable=True)
+
+
+class SchemaMigration(Base):
+    """Data migrations in migrate.py that have already been applied."""
+
+    __tablename__ = "schema_migrations"
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -18,12 +18,22 @@ class UserLoginParams(BaseModel):
 
 class UserResponse(BaseModel):
     jwt_token: str
+    refresh_token: str
     name: str
     id: int
     depart: str
     job: str
 
 
+class TokenRefreshParams(BaseModel):
+    refresh_token: str
+
+
+class TokenResponse(BaseModel):
+    jwt_token: str
+    refresh_token: str
+
+
 class QuestionDetailResponse(BaseModel):
     question_id: int
     question_type: str
@@ -73,10 +83,21 @@ class UserAnswer(BaseModel):
 
 
 class ExamSubmitParams(BaseModel):
+    exam_id: int
+    # Answers not listed here are taken from earlier autosaves
+    user_answers: List[UserAnswer] = []
+
+
+class ExamAutosaveParams(BaseModel):
     exam_id: int
     user_answers: List[UserAnswer]
 
 
+class ExamAutosaveResponse(BaseModel):
+    exam_id: int
+    saved: int
+
+
 class ExamSubmitResponse(BaseModel):
     exam_id: int
     score: int
@@ -115,6 +136,35 @@ class QuestionHistoryListResponse(BaseModel):
     total_page: int
 
 
+class QuestionStatResponse(BaseModel):
+    question_id: int
+    attempts: int
+    correct: int
+    correct_rate: float
+    discrimination: Optional[float]
+    avg_time: float
+
+
+class QuestionStatListResponse(BaseModel):
+    stats: List[QuestionStatResponse]
+    total: int
+    current_page: int
+    total_page: int
+
+
+class DepartmentStatResponse(BaseModel):
+    depart: str
+    job: Optional[str]
+    attempts: int
+    correct: int
+    correct_rate: float
+    avg_time: float
+
+
+class DepartmentStatListResponse(BaseModel):
+    stats: List[DepartmentStatResponse]
+
+
 class AIChatParams(BaseModel):
     exam_id: int
     question_id: int
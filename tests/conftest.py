@@ -0,0 +1,102 @@
+import os
+import tempfile
+import threading
+
+# Point the app at a throwaway database before anything imports database.py
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from cache import InProcessCacheBackend
+from database import SessionLocal, get_engine
+from exam_session import ExamSessionStore
+from migrate import migrate
+from models import Base, Exercise, Question
+
+
+@pytest.fixture(scope="session")
+def redis_server():
+    """A local fake Redis server, reachable over TCP like a real one."""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield f"redis://{host}:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_url(redis_server):
+    import redis
+
+    client = redis.Redis.from_url(redis_server)
+    client.flushall()
+    client.close()
+    return redis_server
+
+
+@pytest.fixture
+def db_engine():
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    migrate(engine)
+    yield engine
+
+
+@pytest.fixture
+def client(db_engine, monkeypatch):
+    # Module-level caches would otherwise leak ids between fresh databases
+    monkeypatch.setattr(main, "exam_sessions", ExamSessionStore())
+    main.question_bank.backend = main.leaderboard_cache.backend = (
+        InProcessCacheBackend()
+    )
+    with TestClient(main.create_app()) as c:
+        yield c
+
+
+@pytest.fixture
+def exercise(db_engine):
+    """An exercise with three questions whose answer is always "A"."""
+    db = SessionLocal()
+    ex = Exercise(title="t", content="c")
+    db.add(ex)
+    db.flush()
+    for i in range(3):
+        db.add(
+            Question(
+                question_type="single",
+                content=f"q{i}",
+                options=["A", "B"],
+                answer="A",
+                exercise_id=ex.id,
+            )
+        )
+    db.commit()
+    ex_id = ex.id
+    db.close()
+    return ex_id
+
+
+@pytest.fixture
+def register(client):
+    """Register a user, returning the response and auth headers."""
+
+    def _register(login_number="1", depart="d", job="j"):
+        resp = client.post(
+            "/api/user/register",
+            json={
+                "login_number": login_number,
+                "name": "n",
+                "depart": depart,
+                "job": job,
+                "password": "p",
+            },
+        )
+        data = resp.json()
+        return data, {"Authorization": "Bearer " + data["jwt_token"]}
+
+    return _register
@@ -0,0 +1,171 @@
+import random
+
+import numpy as np
+import pytest
+from sqlalchemy import update
+
+from analytics import refresh_analytics
+from analytics_refresher import AnalyticsRefresher
+from database import SessionLocal
+from migrate import reset_analytics
+from models import (
+    DepartmentStat,
+    Exam,
+    ExamHistory,
+    Question,
+    QuestionHistory,
+    QuestionStat,
+    User,
+)
+
+
+@pytest.fixture
+def db(db_engine):
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def seed(db, rng, n_exams, question_ids, users):
+    """Add submitted exams with random answers, returning the graded rows."""
+    for _ in range(n_exams):
+        user = rng.choice(users)
+        exam = Exam(user_id=user.id, title="x")
+        db.add(exam)
+        db.flush()
+        correct = [rng.random() < 0.6 for _ in question_ids]
+        db.add(
+            ExamHistory(
+                user_id=user.id,
+                exam_id=exam.id,
+                score=10 * sum(correct),
+                time_used=rng.randint(30, 300),
+                question_count=len(question_ids),
+            )
+        )
+        for q_id, is_correct in zip(question_ids, correct):
+            db.add(
+                QuestionHistory(
+                    user_id=user.id,
+                    exam_id=exam.id,
+                    question_id=q_id,
+                    user_answer="A" if is_correct else "B",
+                    is_correct=is_correct,
+                )
+            )
+    db.commit()
+
+
+def setup_bank(db):
+    questions = [Question(content=f"q{i}", answer="A") for i in range(4)]
+    users = [
+        User(login_number=str(i), depart=f"d{i % 2}", job=f"j{i % 3}") for i in range(6)
+    ]
+    db.add_all(questions + users)
+    db.commit()
+    return [q.id for q in questions], users
+
+
+def stats(db):
+    questions = {
+        s.question_id: (s.attempts, s.correct, s.correct_rate, s.discrimination)
+        for s in db.query(QuestionStat)
+    }
+    departments = {
+        (s.depart, s.job): (s.attempts, s.correct, s.correct_rate, s.avg_time)
+        for s in db.query(DepartmentStat)
+    }
+    return questions, departments
+
+
+def assert_stats_close(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, values in expected.items():
+        assert actual[key] == pytest.approx(values), key
+
+
+def test_discrimination_is_point_biserial_correlation(db):
+    rng = random.Random(1)
+    question_ids, users = setup_bank(db)
+    seed(db, rng, 40, question_ids, users)
+
+    assert refresh_analytics(db) == 40 * len(question_ids)
+
+    for q_id in question_ids:
+        rows = (
+            db.query(QuestionHistory.is_correct, ExamHistory.score)
+            .join(ExamHistory, ExamHistory.exam_id == QuestionHistory.exam_id)
+            .filter(QuestionHistory.question_id == q_id)
+            .all()
+        )
+        x, y = np.asarray(rows, dtype=float).T
+        stat = db.get(QuestionStat, q_id)
+        assert stat.attempts == len(x)
+        assert stat.correct_rate == pytest.approx(x.mean())
+        assert stat.discrimination == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+
+def test_incremental_refresh_matches_full_rebuild(db):
+    rng = random.Random(2)
+    question_ids, users = setup_bank(db)
+    seed(db, rng, 20, question_ids, users)
+    refresh_analytics(db, chunk_size=7)
+    # nothing changed, so nothing is counted again
+    assert refresh_analytics(db) == 0
+
+    seed(db, rng, 10, question_ids, users)
+    # regrade a few already counted rows
+    db.execute(
+        update(QuestionHistory)
+        .where(QuestionHistory.id.in_([1, 2, 3]))
+        .values(is_correct=~QuestionHistory.is_correct)
+    )
+    db.commit()
+    assert refresh_analytics(db, chunk_size=7) == 10 * len(question_ids) + 3
+    incremental = stats(db)
+
+    reset_analytics(db.connection())
+    db.commit()
+    refresh_analytics(db)
+    full = stats(db)
+
+    for actual, expected in zip(incremental, full):
+        assert_stats_close(actual, expected)
+
+
+def test_department_rollup_endpoint(client, register, db):
+    _, headers = register(login_number="admin")
+    question_ids, users = setup_bank(db)
+    seed(db, random.Random(3), 10, question_ids, users)
+    refresh_analytics(db)
+    by_depart = client.get(
+        "/api/analytics/departments", params={"by_job": False}, headers=headers
+    ).json()["stats"]
+
+    departments = stats(db)[1]
+    for row in by_depart:
+        groups = [v for (d, _), v in departments.items() if d == row["depart"]]
+        attempts = sum(g[0] for g in groups)
+        assert row["attempts"] == attempts
+        assert row["avg_time"] == pytest.approx(
+            sum(g[0] * g[3] for g in groups) / attempts
+        )
+
+
+def test_only_one_refresher_holds_the_lease(db_engine):
+    first = AnalyticsRefresher(SessionLocal, interval=60)
+    second = AnalyticsRefresher(SessionLocal, interval=60)
+    assert first.acquire_lease()
+    assert not second.acquire_lease()
+    # the holder renews its own lease
+    assert first.acquire_lease()
+
+    first.release_lease()
+    assert second.acquire_lease()
+    assert not first.acquire_lease()
+
+
+def test_expired_lease_can_be_taken_over(db_engine):
+    stale = AnalyticsRefresher(SessionLocal, interval=60, lease_ttl=-1)
+    assert stale.acquire_lease()
+    assert AnalyticsRefresher(SessionLocal, interval=60).acquire_lease()
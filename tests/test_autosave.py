@@ -0,0 +1,101 @@
+from autosave import AnswerBuffer
+from database import SessionLocal
+from models import QuestionHistory
+
+import main
+
+
+def create_exam(client, headers, exercise):
+    exam = client.post(
+        "/api/exam", json={"title": "x", "exercise_ids": [exercise]}, headers=headers
+    ).json()
+    return exam["exam_id"], [q["question_id"] for q in exam["questions"]]
+
+
+def autosave(client, headers, exam_id, answers):
+    return client.post(
+        "/api/exam/autosave",
+        json={
+            "exam_id": exam_id,
+            "user_answers": [
+                {"question_id": q_id, "answer": a} for q_id, a in answers.items()
+            ],
+        },
+        headers=headers,
+    )
+
+
+def history_rows(exam_id):
+    db = SessionLocal()
+    try:
+        rows = db.query(QuestionHistory).filter(QuestionHistory.exam_id == exam_id)
+        return {qh.question_id: (qh.user_answer, qh.is_correct) for qh in rows}
+    finally:
+        db.close()
+
+
+def test_buffer_coalesces_answers_per_row(db_engine):
+    buffer = AnswerBuffer(SessionLocal)
+    buffer.put(1, "A")
+    buffer.put(1, "B")
+    buffer.put(2, "C")
+    assert buffer.take([1, 3]) == {1: "B"}
+    assert buffer.take([1, 2]) == {2: "C"}
+    assert buffer.flush() == 0
+
+
+def test_autosave_persists_on_flush_and_submit_grades_it(client, register, exercise):
+    _, headers = register()
+    exam_id, q_ids = create_exam(client, headers, exercise)
+
+    resp = autosave(client, headers, exam_id, {q_ids[0]: "B", q_ids[1]: "A"})
+    assert resp.json()["saved"] == 2
+    autosave(client, headers, exam_id, {q_ids[0]: "A"})
+    main.answer_buffer.flush()
+    assert history_rows(exam_id)[q_ids[0]] == ("A", None)
+
+    resp = client.post(
+        "/api/exam/submit", json={"exam_id": exam_id}, headers=headers
+    ).json()
+    assert resp["score"] == 20
+    assert history_rows(exam_id) == {
+        q_ids[0]: ("A", True),
+        q_ids[1]: ("A", True),
+        q_ids[2]: (None, False),
+    }
+
+
+def test_late_flush_does_not_overwrite_graded_rows(client, register, exercise):
+    _, headers = register()
+    exam_id, q_ids = create_exam(client, headers, exercise)
+    client.post(
+        "/api/exam/submit",
+        json={
+            "exam_id": exam_id,
+            "user_answers": [{"question_id": q_ids[0], "answer": "A"}],
+        },
+        headers=headers,
+    )
+    db = SessionLocal()
+    qh_id = (
+        db.query(QuestionHistory.id)
+        .filter(
+            QuestionHistory.exam_id == exam_id,
+            QuestionHistory.question_id == q_ids[0],
+        )
+        .scalar()
+    )
+    db.close()
+
+    main.answer_buffer.put(qh_id, "B")
+    main.answer_buffer.flush()
+    assert history_rows(exam_id)[q_ids[0]] == ("A", True)
+
+
+def test_autosave_rejected_after_submit(client, register, exercise):
+    _, headers = register()
+    exam_id, q_ids = create_exam(client, headers, exercise)
+    client.post("/api/exam/submit", json={"exam_id": exam_id}, headers=headers)
+
+    resp = autosave(client, headers, exam_id, {q_ids[0]: "A"})
+    assert resp.status_code == 409
@@ -0,0 +1,116 @@
+import time
+from types import SimpleNamespace
+
+import main
+from cache import InProcessCacheBackend
+from database import SessionLocal
+from exam_session import ExamSession, ExamSessionStore
+from models import ExamHistory
+
+from test_autosave import create_exam, history_rows
+
+
+def make_session(started_at=None):
+    return ExamSession(
+        exam_id=1,
+        user_id=2,
+        exam_history_id=3,
+        started_at=started_at or time.time(),
+        question_ids=[10, 11],
+        answers={10: "A", 11: "B"},
+        history_ids={10: 100, 11: 101},
+        questions={10: {"question_id": 10}, 11: {"question_id": 11}},
+        saved_answers={10: "B"},
+    )
+
+
+def test_store_round_trips_sessions():
+    store = ExamSessionStore()
+    session = make_session()
+    store.save(session)
+    assert store.get(1, 2) == session
+
+    # a loaded session is a copy; changes only stick once saved
+    store.get(1, 2).saved_answers[11] = "B"
+    assert store.get(1, 2).saved_answers == {10: "B"}
+
+    store.discard(1, 2)
+    assert store.get(1, 2) is None
+
+
+def test_sessions_expire_with_the_exam_time_limit():
+    store = ExamSessionStore(ttl=60)
+    store.save(make_session(started_at=time.time() - 61))
+    assert store.get(1, 2) is None
+
+
+def test_in_process_backend_purges_expired_entries(monkeypatch):
+    backend = InProcessCacheBackend()
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    backend._next_purge = 0
+    backend.set("old", 1, 10)
+    now[0] += 20
+    backend._next_purge = 0
+    backend.set("new", 2, 10)
+    assert list(backend._items) == ["new"]
+
+
+def submit_at(client, headers, exam_id, answers, seconds, monkeypatch):
+    """Submit as if `seconds` passed since the exam started."""
+    db = SessionLocal()
+    eh = db.query(ExamHistory).filter(ExamHistory.exam_id == exam_id).one()
+    started_at = eh.created_at.timestamp()
+    db.close()
+    with monkeypatch.context() as m:
+        m.setattr(main, "time", SimpleNamespace(time=lambda: started_at + seconds))
+        resp = client.post(
+            "/api/exam/submit",
+            json={
+                "exam_id": exam_id,
+                "user_answers": [
+                    {"question_id": q_id, "answer": a} for q_id, a in answers.items()
+                ],
+            },
+            headers=headers,
+        )
+    db = SessionLocal()
+    time_used = (
+        db.query(ExamHistory.time_used).filter(ExamHistory.exam_id == exam_id).scalar()
+    )
+    db.close()
+    return resp.json()["score"], time_used
+
+
+def test_submit_falls_back_to_db_without_a_session(
+    client, register, exercise, monkeypatch
+):
+    _, headers = register()
+    cached_id, cached_qs = create_exam(client, headers, exercise)
+    rebuilt_id, rebuilt_qs = create_exam(client, headers, exercise)
+    db = SessionLocal()
+    user_id = db.query(ExamHistory.user_id).filter_by(exam_id=rebuilt_id).scalar()
+    db.close()
+    # e.g. the session expired, was evicted or lived on a restarted worker
+    main.exam_sessions.discard(rebuilt_id, user_id)
+    assert main.exam_sessions.get(rebuilt_id, user_id) is None
+
+    results = [
+        submit_at(
+            client,
+            headers,
+            exam_id,
+            {q_ids[0]: "A", q_ids[1]: "B"},
+            42,
+            monkeypatch,
+        )
+        for exam_id, q_ids in ((cached_id, cached_qs), (rebuilt_id, rebuilt_qs))
+    ]
+    assert results[0] == results[1] == (10, 42)
+
+    def graded(exam_id, q_ids):
+        rows = history_rows(exam_id)
+        return [rows[q_id] for q_id in q_ids]
+
+    assert graded(cached_id, cached_qs) == graded(rebuilt_id, rebuilt_qs)
+    assert graded(rebuilt_id, rebuilt_qs) == [("A", True), ("B", False), (None, False)]
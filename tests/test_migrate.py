@@ -0,0 +1,73 @@
+from sqlalchemy import delete
+
+from database import SessionLocal
+from migrate import migrate
+from models import (
+    Exam,
+    ExamHistory,
+    QuestionHistory,
+    SchemaMigration,
+    User,
+)
+
+
+def add_exam(db, user, score, time_used, answers):
+    exam = Exam(user_id=user.id, title="x")
+    db.add(exam)
+    db.flush()
+    db.add(
+        ExamHistory(user_id=user.id, exam_id=exam.id, score=score, time_used=time_used)
+    )
+    for q_id, answer in enumerate(answers, 1):
+        db.add(
+            QuestionHistory(
+                user_id=user.id,
+                exam_id=exam.id,
+                question_id=q_id,
+                user_answer=answer,
+                is_correct=answer == "A" if answer else False,
+            )
+        )
+    db.flush()
+    return exam.id
+
+
+def test_migrate_resets_grades_of_unsubmitted_exams(db_engine):
+    db = SessionLocal()
+    user = User(login_number="1", password="x")
+    db.add(user)
+    db.flush()
+    open_exam = add_exam(db, user, 0, 0, [None, None])
+    wrong_exam = add_exam(db, user, 0, 30, ["B", None])
+    right_exam = add_exam(db, user, 10, 30, ["A", "B"])
+    # pretend the database predates the migration
+    db.execute(delete(SchemaMigration))
+    db.commit()
+
+    migrate(db_engine)
+
+    grades = {
+        exam_id: [
+            qh.is_correct
+            for qh in db.query(QuestionHistory)
+            .filter(QuestionHistory.exam_id == exam_id)
+            .order_by(QuestionHistory.question_id)
+        ]
+        for exam_id in (open_exam, wrong_exam, right_exam)
+    }
+    db.close()
+    assert grades == {
+        open_exam: [None, None],
+        wrong_exam: [False, False],
+        right_exam: [True, False],
+    }
+
+
+def test_data_migrations_run_once(db_engine, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "migrate.DATA_MIGRATIONS", [("once", lambda conn: calls.append(conn))]
+    )
+    migrate(db_engine)
+    migrate(db_engine)
+    assert len(calls) == 1
@@ -0,0 +1,156 @@
+import time
+
+import redis
+
+import cache
+import main
+from autosave import AnswerBuffer
+from cache import (
+    Cache,
+    InProcessCacheBackend,
+    RedisCacheBackend,
+    RedisInvalidationBus,
+)
+from database import SessionLocal
+from exam_session import ExamSessionStore
+
+from test_autosave import autosave, create_exam, history_rows
+from test_exam_session import make_session
+
+
+def new_backend(url):
+    # a client of its own, as another worker would have
+    return RedisCacheBackend(redis.Redis.from_url(url))
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_redis_backend_values_and_hashes(redis_url):
+    backend = new_backend(redis_url)
+    backend.set("k", {"a": [1, 2]}, 60)
+    assert new_backend(redis_url).get("k") == {"a": [1, 2]}
+    backend.set("short", 1, 0.05)
+    assert wait_for(lambda: backend.get("short") is None)
+
+    backend.hset("h", {"1": "A"}, 60)
+    backend.hset("h", {"2": "B"}, 60)
+    assert new_backend(redis_url).hgetall("h") == {"1": "A", "2": "B"}
+
+    backend.delete(["k", "h"])
+    assert backend.get("k") is None and backend.hgetall("h") == {}
+
+
+def test_invalidation_reaches_other_workers(redis_url):
+    workers = []
+    for _ in range(2):
+        bus = RedisInvalidationBus(redis.Redis.from_url(redis_url))
+        workers.append((Cache("ns", 60, InProcessCacheBackend(), bus), bus))
+        bus.start()
+    try:
+        client = redis.Redis.from_url(redis_url)
+        channel = cache.CACHE_INVALIDATION_CHANNEL
+        assert wait_for(lambda: client.pubsub_numsub(channel)[0][1] == 2)
+        for c, _ in workers:
+            c.set(1, "stale")
+        workers[0][0].invalidate(1)
+        assert workers[0][0].get(1) is None
+        assert wait_for(lambda: workers[1][0].get(1) is None)
+    finally:
+        for _, bus in workers:
+            bus.close()
+
+
+def test_sessions_are_shared_between_workers(redis_url):
+    worker_a = ExamSessionStore(new_backend(redis_url))
+    worker_b = ExamSessionStore(new_backend(redis_url))
+    session = make_session()
+    worker_a.save(session)
+    assert worker_b.get(1, 2) == session
+
+    # saves of different questions from two workers both survive
+    assert worker_a.save_answers(session, {10: "A"})
+    assert worker_b.save_answers(session, {11: "A"})
+    assert worker_a.get(1, 2).saved_answers == {10: "A", 11: "A"}
+
+    worker_b.discard(1, 2)
+    assert worker_a.get(1, 2) is None
+
+
+def test_redis_url_shares_sessions_without_shared_cache(redis_url, monkeypatch):
+    monkeypatch.setattr(cache, "REDIS_URL", redis_url)
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "memory")
+    assert isinstance(cache.shared_backend_from_env(), RedisCacheBackend)
+    assert isinstance(cache.cache_backend_from_env(), InProcessCacheBackend)
+
+
+def test_submit_on_another_worker_sees_unflushed_autosaves(
+    client, register, exercise, redis_url, monkeypatch
+):
+    _, headers = register()
+    monkeypatch.setattr(main, "exam_sessions", ExamSessionStore(new_backend(redis_url)))
+    exam_id, q_ids = create_exam(client, headers, exercise)
+    # worker A acknowledges the autosave but has not flushed it yet
+    worker_a_buffer = main.answer_buffer
+    assert (
+        autosave(client, headers, exam_id, {q_ids[0]: "A", q_ids[1]: "A"}).status_code
+        == 200
+    )
+
+    # worker B has its own buffer and session store client
+    monkeypatch.setattr(main, "answer_buffer", AnswerBuffer(SessionLocal))
+    monkeypatch.setattr(main, "exam_sessions", ExamSessionStore(new_backend(redis_url)))
+    resp = client.post(
+        "/api/exam/submit",
+        json={"exam_id": exam_id, "user_answers": []},
+        headers=headers,
+    )
+    assert resp.json()["score"] == 20
+
+    # A's late flush does not touch the graded rows
+    worker_a_buffer.flush()
+    rows = history_rows(exam_id)
+    assert rows[q_ids[0]] == ("A", True) and rows[q_ids[1]] == ("A", True)
+
+
+def test_autosave_writes_through_when_sessions_are_unreachable(
+    client, register, exercise, monkeypatch
+):
+    _, headers = register()
+    exam_id, q_ids = create_exam(client, headers, exercise)
+    store = main.exam_sessions
+
+    def fail(*args):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(store.backend, "hset", fail)
+    assert autosave(client, headers, exam_id, {q_ids[0]: "B"}).status_code == 200
+    assert history_rows(exam_id)[q_ids[0]] == ("B", None)
+
+
+def test_submit_succeeds_when_cache_invalidation_fails(
+    client, register, exercise, monkeypatch
+):
+    _, headers = register()
+    exam_id, q_ids = create_exam(client, headers, exercise)
+
+    def fail(*args):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(main.leaderboard_cache.backend, "delete", fail)
+    resp = client.post(
+        "/api/exam/submit",
+        json={
+            "exam_id": exam_id,
+            "user_answers": [{"question_id": q_ids[0], "answer": "A"}],
+        },
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert resp.json()["score"] == 10
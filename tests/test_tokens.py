@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+from jose import jwt
+
+import tokens
+from tokens import DEFAULT_KID, KeySet, TokenCache, TokenService
+
+
+def test_cache_drops_expired_claims(monkeypatch):
+    cache = TokenCache()
+    now = 1_000_000.0
+    monkeypatch.setattr(tokens.time, "time", lambda: now)
+    cache.put("t", {"sub": "1", "exp": now + 60})
+    assert cache.get("t") == {"sub": "1", "exp": now + 60}
+
+    now += 60
+    assert cache.get("t") is None
+    # the entry is gone, not just hidden
+    now -= 60
+    assert cache.get("t") is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TokenCache(maxsize=2)
+    exp = {"exp": 2**40}
+    cache.put("a", exp)
+    cache.put("b", exp)
+    cache.get("a")
+    cache.put("c", exp)
+    assert cache.get("a") and cache.get("c")
+    assert cache.get("b") is None
+
+
+def test_cache_ignores_claims_without_exp():
+    cache = TokenCache()
+    cache.put("t", {"sub": "1"})
+    assert cache.get("t") is None
+
+
+def test_tokens_from_before_key_ids_verify_under_default_kid():
+    legacy = jwt.encode({"sub": "1"}, "old", algorithm=tokens.ALGORITHM)
+    service = TokenService(KeySet({DEFAULT_KID: "old", "k2": "new"}, "k2"))
+    assert service.decode(legacy)["sub"] == "1"
+
+    # without the old secret listed they are rejected
+    with pytest.raises(jwt.JWTError):
+        TokenService(KeySet({"k2": "new"}, "k2")).decode(legacy)
+
+
+def test_refresh_token_is_not_an_access_token():
+    service = TokenService(KeySet({"k": "s"}, "k"))
+    refresh = service.create_refresh_token({"sub": "1"}, datetime.timedelta(minutes=1))
+    assert service.decode(refresh, "refresh")["sub"] == "1"
+    with pytest.raises(jwt.JWTError):
+        service.decode(refresh)
@@ -0,0 +1,142 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from jose import jwt
+
+from utils import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+TOKEN_CACHE_SIZE = 10000
+# kid assumed for tokens issued before keys had ids
+DEFAULT_KID = "default"
+
+
+class KeySet:
+    """Signing keys identified by kid; only the active key signs new tokens."""
+
+    def __init__(self, keys: Dict[str, str], active_kid: str):
+        if active_kid not in keys:
+            raise ValueError(f"Unknown active key id: {active_kid}")
+        self.keys = dict(keys)
+        self.active_kid = active_kid
+
+    @classmethod
+    def from_env(cls) -> "KeySet":
+        # JWT_KEYS="kid1:secret1,kid2:secret2", JWT_ACTIVE_KID="kid2"
+        raw = os.environ.get("JWT_KEYS")
+        if not raw:
+            return cls({DEFAULT_KID: SECRET_KEY}, DEFAULT_KID)
+        keys = dict(item.split(":", 1) for item in raw.split(",") if item)
+        return cls(keys, os.environ.get("JWT_ACTIVE_KID", list(keys)[-1]))
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(
+            claims,
+            self.keys[self.active_kid],
+            algorithm=ALGORITHM,
+            headers={"kid": self.active_kid},
+        )
+
+    def verify(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.JWTError(f"Unknown key id: {kid}")
+        return jwt.decode(token, key, algorithms=[ALGORITHM])
+
+
+class TokenCache:
+    """Bounded LRU of verified claims keyed by token digest, honouring exp."""
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._digest(token)
+        with self._lock:
+            claims = self._items.get(key)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        if "exp" not in claims:
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._items[key] = claims
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class TokenService:
+    def __init__(self, keys: KeySet, cache: Optional[TokenCache] = None):
+        self.keys = keys
+        self.cache = cache or TokenCache()
+
+    def _issue(self, data: dict, token_type: str, expires_delta: datetime.timedelta):
+        to_encode = data.copy()
+        expire = datetime.datetime.utcnow() + expires_delta
+        to_encode.update({"exp": expire, "type": token_type})
+        return self.keys.sign(to_encode)
+
+    def create_access_token(
+        self, data: dict, expires_delta: datetime.timedelta = None
+    ) -> str:
+        return self._issue(
+            data,
+            "access",
+            expires_delta or datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        )
+
+    def create_refresh_token(
+        self, data: dict, expires_delta: datetime.timedelta = None
+    ) -> str:
+        # jti keeps refresh tokens issued within the same second distinct
+        return self._issue(
+            {**data, "jti": uuid.uuid4().hex},
+            "refresh",
+            expires_delta or datetime.timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+
+    def decode(self, token: str, token_type: str = "access") -> dict:
+        claims = self.cache.get(token)
+        if claims is None:
+            claims = self.keys.verify(token)
+            self.cache.put(token, claims)
+        # tokens issued before refresh tokens existed carry no type
+        if claims.get("type", "access") != token_type:
+            raise jwt.JWTError(f"Token type must be {token_type}")
+        return claims
+
+
+token_service = TokenService(KeySet.from_env())
+
+
+def create_access_token(data: dict, expires_delta: datetime.timedelta = None) -> str:
+    return token_service.create_access_token(data, expires_delta)
+
+
+def create_refresh_token(data: dict, expires_delta: datetime.timedelta = None) -> str:
+    return token_service.create_refresh_token(data, expires_delta)
+
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    return token_service.decode(token, token_type)